@@ -1,15 +1,51 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
 from app.api import deps
+from app.core.http_cache import cached_json_response
+from app.core.config import IOT_DEVICE_ID
 from app.services.iot_service import iot_service
-from typing import Any
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional
 
 router = APIRouter()
 
+MAX_HISTORY_SPAN = timedelta(days=31)
+# get_history asks for limit + 1 rows, which must stay within PostgREST's max-rows (1000 by default)
+MAX_HISTORY_LIMIT = 999
+
 @router.get("/status")
-async def get_iot_status(current_user: Any = Depends(deps.get_current_user)):
-    return iot_service.get_state()
+async def get_iot_status(request: Request, current_user: Any = Depends(deps.get_current_user)):
+    body, etag = iot_service.get_serialized_state()
+    return cached_json_response(request, body, etag)
 
 @router.post("/motor/toggle")
 async def toggle_motor(current_user: Any = Depends(deps.get_current_user)):
     new_state = await iot_service.toggle_motor(user=current_user)
     return {"motor_on": new_state, "message": "Motor toggled successfully"}
+
+@router.get("/history")
+async def get_iot_history(
+    start: datetime,
+    end: Optional[datetime] = None,
+    device_id: str = IOT_DEVICE_ID,
+    limit: int = Query(500, ge=1, le=MAX_HISTORY_LIMIT),
+    after: Optional[datetime] = None,
+    current_user: Any = Depends(deps.get_current_user),
+):
+    """
+    Readings in [start, end), oldest first, at most `limit` per page. When more remain,
+    `next_after` is set: repeat the request with `after=<next_after>` for the next page.
+    """
+    # Naive timestamps are taken as UTC, matching what log_reading stores
+    end = end or datetime.now(timezone.utc)
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=timezone.utc)
+    if end.tzinfo is None:
+        end = end.replace(tzinfo=timezone.utc)
+    if after is not None and after.tzinfo is None:
+        after = after.replace(tzinfo=timezone.utc)
+    if end <= start or end - start > MAX_HISTORY_SPAN:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Range must be positive and at most {MAX_HISTORY_SPAN.days} days",
+        )
+    return await iot_service.get_history(device_id, start, end, limit, after=after)
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pydantic_settings import BaseSettings
 from typing import List
 from enum import Enum
@@ -18,6 +19,9 @@ ROLE_HIERARCHY = {
     Role.CUSTOMER: 1
 }
 
+# The single IoT unit the service polls and drives; also the default device rate-limit key
+IOT_DEVICE_ID = "main_iot_unit"
+
 class Settings(BaseSettings):
     PROJECT_NAME: str = "EvaraTech API"
     API_V1_STR: str = "/api/v1"
@@ -27,6 +31,25 @@ class Settings(BaseSettings):
 
     SUPABASE_URL: str = os.getenv("SUPABASE_URL", "")
     SUPABASE_KEY: str = os.getenv("SUPABASE_ANON_KEY", "")
+    # Bypasses RLS; only TelemetryRepository uses it (telemetry is closed to the anon key)
+    SUPABASE_SERVICE_ROLE_KEY: str = os.getenv("SUPABASE_SERVICE_ROLE_KEY", "")
+
+    # Shared state across uvicorn workers: "mmap" (host-wide file) or "local" (single process)
+    STATE_BACKEND: str = os.getenv("STATE_BACKEND", "mmap")
+    STATE_DIR: str = os.getenv("STATE_DIR", tempfile.gettempdir())
+    # Keeps deployments on one host apart; empty = scoped to the uvicorn/gunicorn master process
+    STATE_NAMESPACE: str = os.getenv("STATE_NAMESPACE", "")
+    STATE_MMAP_SIZE: int = 64 * 1024
+
+    GZIP_MIN_SIZE: int = 1024
+
+    # Admission control (per worker process)
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_MAX_KEYS: int = 10_000
+    # Reverse proxies whose X-Forwarded-For is believed when keying limits by IP
+    RATE_LIMIT_TRUSTED_PROXIES: List[str] = []
+    SHED_MAX_IN_FLIGHT: int = 256
+    SHED_MAX_LOOP_LAG_MS: int = 250
 
     BACKEND_CORS_ORIGINS: List[str] = ["http://localhost:3000", "http://localhost:3001", "http://localhost:5173", "http://localhost:8080"]
 
@@ -0,0 +1,22 @@
+import hashlib
+from typing import Optional
+from fastapi import Request, Response, status
+
+def make_etag(body: bytes) -> str:
+    # Weak validator: GZipMiddleware may re-encode the body after we tag it
+    return f'W/"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+def cached_json_response(request: Request, body: bytes, etag: str) -> Response:
+    """Serve a pre-serialized JSON body, or 304 when the client already has this version."""
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,200 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qs
+from fastapi import status
+from fastapi.responses import JSONResponse
+from jose import jwt, JWTError
+from loguru import logger
+from app.core.config import IOT_DEVICE_ID, settings
+
+class TokenBucketLimiter:
+    """
+    Token bucket per key. Buckets live in an LRU so memory is bounded by max_keys;
+    an evicted key simply comes back with a full bucket.
+    """
+    def __init__(self, rate: float, burst: int, max_keys: int):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def _refill(self, key: str, now: float) -> float:
+        tokens, last = self._buckets.get(key, (float(self.burst), now))
+        return min(float(self.burst), tokens + (now - last) * self.rate)
+
+    def check(self, key: str) -> float:
+        """Seconds until `key` has a token (0 when one is available), without taking it."""
+        tokens = self._refill(key, time.monotonic())
+        return 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+
+    def acquire(self, key: str) -> float:
+        """Take one token. Returns 0 when allowed, otherwise seconds until a token is available."""
+        now = time.monotonic()
+        tokens = self._refill(key, now)
+        self._buckets.pop(key, None)
+
+        if tokens >= 1:
+            tokens -= 1
+            wait = 0.0
+        else:
+            wait = (1 - tokens) / self.rate
+
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+class RateRule(NamedTuple):
+    path: Optional[str]  # None applies to every request
+    scope: str           # "user", "ip" or "device"
+    per_minute: float
+    burst: int
+
+# Paths are relative to API_V1_STR. "ip" keys need the real client address behind a proxy, see _client_ip.
+RATE_LIMIT_RULES: List[RateRule] = [
+    RateRule("/auth/login", "ip", 5, 5),
+    RateRule("/iot/motor/toggle", "user", 6, 3),
+    RateRule("/iot/motor/toggle", "device", 12, 4),
+    RateRule("/ai/command", "user", 30, 10),
+    RateRule(None, "user", 1200, 40),
+]
+
+# Never shed these: health checks and the motor/status path the dashboard depends on
+SHED_EXEMPT_PATHS = {"/health", "/iot/status", "/iot/motor/toggle"}
+
+class LoadShedder:
+    """Tracks in-flight requests and event-loop lag to decide when to reject new work."""
+    def __init__(self, max_in_flight: int, max_loop_lag: float):
+        self.max_in_flight = max_in_flight
+        self.max_loop_lag = max_loop_lag
+        self.in_flight = 0
+        self.loop_lag = 0.0
+
+    def should_shed(self) -> bool:
+        return self.in_flight >= self.max_in_flight or self.loop_lag >= self.max_loop_lag
+
+    async def monitor_loop_lag(self, interval: float = 0.1):
+        """Measure how late a short sleep wakes up; a busy loop oversleeps."""
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(interval)
+            self.loop_lag = max(0.0, loop.time() - start - interval)
+
+load_shedder = LoadShedder(settings.SHED_MAX_IN_FLIGHT, settings.SHED_MAX_LOOP_LAG_MS / 1000)
+
+class RateLimitMiddleware:
+    """ASGI admission control: load shedding first, then per-user/IP/device token buckets."""
+    def __init__(self, app: Any, rules: List[RateRule] = RATE_LIMIT_RULES, shedder: LoadShedder = load_shedder):
+        self.app = app
+        self.rules = rules
+        self.shedder = shedder
+        self.limiters: Dict[RateRule, TokenBucketLimiter] = {
+            rule: TokenBucketLimiter(rule.per_minute / 60, rule.burst, settings.RATE_LIMIT_MAX_KEYS)
+            for rule in rules
+        }
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        path = scope["path"]
+        if path.startswith(settings.API_V1_STR):
+            path = path[len(settings.API_V1_STR):]
+
+        if path not in SHED_EXEMPT_PATHS and self.shedder.should_shed():
+            logger.warning(f"SHED: Rejecting {path} (in_flight={self.shedder.in_flight}, lag={self.shedder.loop_lag:.3f}s)")
+            response = JSONResponse(
+                {"detail": "Server is overloaded, please retry shortly"},
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={"Retry-After": "1"},
+            )
+            await response(scope, receive, send)
+            return
+
+        wait = self._check_limits(path, scope)
+        if wait > 0:
+            response = JSONResponse(
+                {"detail": "Too many requests"},
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                headers={"Retry-After": str(math.ceil(wait))},
+            )
+            await response(scope, receive, send)
+            return
+
+        self.shedder.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.shedder.in_flight -= 1
+
+    def _check_limits(self, path: str, scope: Dict[str, Any]) -> float:
+        keys: Dict[str, str] = {}  # decode the bearer token at most once per request
+        matched: List[Tuple[TokenBucketLimiter, str]] = []
+        for rule in self.rules:
+            if rule.path is not None and rule.path != path:
+                continue
+            if rule.scope not in keys:
+                keys[rule.scope] = self._key_for(rule.scope, scope)
+            matched.append((self.limiters[rule], keys[rule.scope]))
+
+        # Only spend tokens once every rule admits the request, so a rejection
+        # by one bucket does not drain the others. Single event loop: no race in between.
+        wait = max((limiter.check(key) for limiter, key in matched), default=0.0)
+        if wait > 0:
+            return wait
+        for limiter, key in matched:
+            limiter.acquire(key)
+        return 0.0
+
+    def _key_for(self, key_scope: str, scope: Dict[str, Any]) -> str:
+        if key_scope == "device":
+            return f"device:{_query_param(scope, 'device_id') or IOT_DEVICE_ID}"
+        if key_scope == "user":
+            user_id = _user_id_from_token(scope)
+            if user_id:
+                return f"user:{user_id}"
+        return f"ip:{_client_ip(scope)}"
+
+def _query_param(scope: Dict[str, Any], name: str) -> Optional[str]:
+    values = parse_qs(scope.get("query_string", b"").decode()).get(name)
+    return values[0] if values else None
+
+def _client_ip(scope: Dict[str, Any]) -> str:
+    """
+    Peer address, or the nearest untrusted X-Forwarded-For hop when the peer is one of
+    RATE_LIMIT_TRUSTED_PROXIES. Behind a proxy, either list it there or run uvicorn with
+    --proxy-headers --forwarded-allow-ips=<proxy ip>; otherwise every client shares the
+    proxy's address and per-IP limits (e.g. /auth/login) apply to all users at once.
+    """
+    client = scope.get("client")
+    ip = client[0] if client else "unknown"
+    trusted = settings.RATE_LIMIT_TRUSTED_PROXIES
+    if ip not in trusted:
+        return ip
+
+    for name, value in scope.get("headers", []):
+        if name == b"x-forwarded-for":
+            for hop in reversed(value.decode().split(",")):
+                hop = hop.strip()
+                if hop and hop not in trusted:
+                    return hop
+    return ip
+
+def _user_id_from_token(scope: Dict[str, Any]) -> Optional[str]:
+    """Signature-checked subject from the bearer token; no DB lookup, auth proper still runs later."""
+    for name, value in scope.get("headers", []):
+        if name == b"authorization":
+            scheme, _, token = value.decode().partition(" ")
+            if scheme.lower() != "bearer" or not token:
+                return None
+            try:
+                payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+            except JWTError:
+                return None
+            return payload.get("sub")
+    return None
@@ -0,0 +1,239 @@
+import copy
+import json
+import mmap
+import os
+import struct
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+from loguru import logger
+from app.core.config import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows dev machines: no flock, fall back to in-process state
+    fcntl = None
+
+# Header layout of the mmap file: [version: u64][payload length: u32][json payload ...]
+_HEADER = struct.Struct("<QI")
+
+# Lock-free read attempts before a reader falls back to taking the flock
+_READ_SPINS = 1000
+
+StateMutator = Callable[[Dict[str, Any]], None]
+
+class StateStore(ABC):
+    """
+    Versioned key/value state shared by every worker process.
+    Readers get a private copy, writers go through update() so read-modify-write is atomic.
+    """
+    @abstractmethod
+    def _current(self) -> Tuple[int, Dict[str, Any]]:
+        """Live (version, state) pair; the dict is shared and must not be mutated."""
+
+    @abstractmethod
+    def update(self, mutate: StateMutator) -> Dict[str, Any]: ...
+
+    def snapshot(self) -> Tuple[int, Dict[str, Any]]:
+        version, state = self._current()
+        return version, copy.deepcopy(state)
+
+    def read(self) -> Dict[str, Any]:
+        return self.snapshot()[1]
+
+    @property
+    def version(self) -> int:
+        return self._current()[0]
+
+class LocalStateStore(StateStore):
+    """In-process stand-in, only consistent with a single worker."""
+    def __init__(self, default: Dict[str, Any]):
+        self._lock = threading.Lock()
+        self._version = 0
+        self._state = copy.deepcopy(default)
+
+    def _current(self) -> Tuple[int, Dict[str, Any]]:
+        return self._version, self._state
+
+    def update(self, mutate: StateMutator) -> Dict[str, Any]:
+        with self._lock:
+            state = copy.deepcopy(self._state)
+            mutate(state)
+            self._state = state
+            self._version += 2
+            return copy.deepcopy(state)
+
+class MmapStateStore(StateStore):
+    """
+    State kept in a memory-mapped file shared by all workers on the host.
+    Writers serialise on flock and bump the version around the write (seqlock);
+    readers never lock and only re-parse the JSON when the version has moved.
+    """
+    def __init__(self, path: str, default: Dict[str, Any], size: int):
+        self.path = path
+        self.size = size
+        self.default = copy.deepcopy(default)
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        self._pid = os.getpid()
+        self._cached_version = -1
+        self._cached_state: Dict[str, Any] = {}
+
+        with self._locked():
+            if os.fstat(self._fd).st_size < size:
+                os.ftruncate(self._fd, size)
+            self._mm = mmap.mmap(self._fd, size)
+            version, state = self._read_locked()
+            # Keys added to the default since the file was created
+            missing = {k: copy.deepcopy(v) for k, v in self.default.items() if k not in state}
+            if version == 0 or missing:
+                state.update(missing)
+                self._write(version, state)
+
+    def _lock_fd(self) -> int:
+        # flock belongs to the open file description, which a forked child shares with
+        # its parent (e.g. gunicorn --preload), so each process needs its own open().
+        if self._pid != os.getpid():
+            os.close(self._fd)
+            self._fd = os.open(self.path, os.O_RDWR)
+            self._pid = os.getpid()
+        return self._fd
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        fd = self._lock_fd()
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def _read_locked(self) -> Tuple[int, Dict[str, Any]]:
+        """Read under the flock. An odd version here means a writer died mid-update."""
+        version, length = _HEADER.unpack_from(self._mm, 0)
+        if version == 0:
+            return version, copy.deepcopy(self.default)
+
+        try:
+            state = json.loads(self._mm[_HEADER.size:_HEADER.size + length])
+        except ValueError:
+            state = None
+
+        if version & 1 or not isinstance(state, dict):
+            logger.warning(f"STATE: Recovering torn write in {self.path}")
+            if not isinstance(state, dict):
+                state = copy.deepcopy(self.default)
+            if version & 1:
+                version += 1
+            version = self._write(version, state)
+        return version, state
+
+    def _write(self, version: int, state: Dict[str, Any]) -> int:
+        """Publish state over an even `version`; returns the new (even) version."""
+        payload = json.dumps(state, separators=(",", ":")).encode()
+        if _HEADER.size + len(payload) > self.size:
+            raise ValueError(f"State payload of {len(payload)} bytes exceeds STATE_MMAP_SIZE")
+        _HEADER.pack_into(self._mm, 0, version + 1, len(payload))
+        self._mm[_HEADER.size:_HEADER.size + len(payload)] = payload
+        _HEADER.pack_into(self._mm, 0, version + 2, len(payload))
+        return version + 2
+
+    def _current(self) -> Tuple[int, Dict[str, Any]]:
+        state = None
+        for _ in range(_READ_SPINS):
+            version, length = _HEADER.unpack_from(self._mm, 0)
+            if version == self._cached_version:
+                return version, self._cached_state
+            if version & 1:
+                continue
+            payload = self._mm[_HEADER.size:_HEADER.size + length]
+            if _HEADER.unpack_from(self._mm, 0)[0] == version:
+                try:
+                    state = json.loads(payload)
+                except ValueError:
+                    pass
+                break
+
+        if not isinstance(state, dict):
+            # Writer stalled or died mid-write, or the payload is corrupt: wait for the
+            # writer, or repair the file ourselves
+            with self._locked():
+                version, state = self._read_locked()
+
+        self._cached_state = state
+        self._cached_version = version
+        return version, state
+
+    def update(self, mutate: StateMutator) -> Dict[str, Any]:
+        with self._locked():
+            version, state = self._read_locked()
+            mutate(state)
+            self._cached_version = self._write(version, state)
+            self._cached_state = state
+            return copy.deepcopy(state)
+
+class LeaderLock:
+    """
+    Non-blocking flock election: the first worker to take the lock is the leader
+    until its process exits, at which point the kernel frees the lock for the next caller.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+        self._pid = os.getpid()
+
+    @property
+    def is_leader(self) -> bool:
+        return self._fd is not None and self._pid == os.getpid()
+
+    def try_acquire(self) -> bool:
+        if self._fd is not None and self._pid != os.getpid():
+            # Inherited across fork: the lock belongs to the parent, not to us
+            if self._fd >= 0:
+                os.close(self._fd)
+            self._fd = None
+        self._pid = os.getpid()
+        if self._fd is not None:
+            return True
+        if fcntl is None:
+            self._fd = -1
+            return True
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+
+        self._fd = fd
+        logger.info(f"LEADER: Worker {os.getpid()} acquired {self.path}")
+        return True
+
+    def release(self):
+        if self._fd is None:
+            return
+        if self._fd >= 0 and self._pid != os.getpid():
+            # Unlocking an inherited fd would release the parent's lock
+            os.close(self._fd)
+        elif self._fd >= 0:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+        self._fd = None
+
+def _state_path(name: str, suffix: str) -> str:
+    # Workers forked by one uvicorn/gunicorn master share its pid as their parent,
+    # so by default each deployment (and each restart) gets fresh state and its own leader.
+    namespace = settings.STATE_NAMESPACE or f"ppid{os.getppid()}"
+    return os.path.join(settings.STATE_DIR, f"evaratech_{namespace}_{name}.{suffix}")
+
+def create_state_store(name: str, default: Dict[str, Any]) -> StateStore:
+    if settings.STATE_BACKEND == "mmap" and fcntl is not None:
+        return MmapStateStore(_state_path(name, "state"), default, settings.STATE_MMAP_SIZE)
+
+    if settings.STATE_BACKEND == "mmap":
+        logger.warning("STATE: flock unavailable on this platform, using in-process state")
+    return LocalStateStore(default)
+
+def create_leader_lock(name: str) -> LeaderLock:
+    return LeaderLock(_state_path(name, "lock"))
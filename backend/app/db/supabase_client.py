@@ -1,7 +1,13 @@
 from supabase import create_client, Client
 from app.core.config import settings
 
-def get_supabase() -> Client:
-    return create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
+def get_supabase(key: str = settings.SUPABASE_KEY) -> Client:
+    return create_client(settings.SUPABASE_URL, key)
 
 supabase: Client = get_supabase()
+
+# Scoped to TelemetryRepository; without the key telemetry goes through the anon
+# client and RLS rejects it (main.py warns at startup)
+service_supabase: Client = (
+    get_supabase(settings.SUPABASE_SERVICE_ROLE_KEY) if settings.SUPABASE_SERVICE_ROLE_KEY else supabase
+)
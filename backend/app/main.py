@@ -1,8 +1,11 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from app.core.config import settings
+from app.core.rate_limit import RateLimitMiddleware, load_shedder
 from app.api.v1.api import api_router
 from loguru import logger
+import asyncio
 import sys
 
 # Configure Logger
@@ -16,6 +19,10 @@ def create_application() -> FastAPI:
         docs_url=f"{settings.API_V1_STR}/docs"
     )
 
+    # Added before CORS so throttled/shed responses still carry CORS headers
+    if settings.RATE_LIMIT_ENABLED:
+        application.add_middleware(RateLimitMiddleware)
+
     # Set all CORS enabled origins
     if settings.BACKEND_CORS_ORIGINS:
         application.add_middleware(
@@ -26,19 +33,39 @@ def create_application() -> FastAPI:
             allow_headers=["*"],
         )
 
+    # Compress larger payloads; small status bodies are cheaper to send as-is
+    application.add_middleware(GZipMiddleware, minimum_size=settings.GZIP_MIN_SIZE)
+
     # Include routers
     application.include_router(api_router, prefix=settings.API_V1_STR)
 
     @application.on_event("startup")
     async def startup_event():
         logger.info("Initializing EvaraTech Python Backend...")
+        if not settings.SUPABASE_SERVICE_ROLE_KEY:
+            logger.error("SUPABASE_SERVICE_ROLE_KEY is not set: telemetry writes and history reads will be rejected by RLS")
         from apscheduler.schedulers.asyncio import AsyncIOScheduler
         from app.services.iot_service import iot_service
         
+        # Every worker schedules the job, but only the poller-lock holder hits ThingSpeak.
+        # If the leader dies, the next worker to tick takes over the lock.
         scheduler = AsyncIOScheduler()
-        scheduler.add_job(iot_service.poll_thingspeak, 'interval', seconds=15)
+        scheduler.add_job(iot_service.poll_if_leader, 'interval', seconds=15)
         scheduler.start()
-        logger.info("Background Polling Started (15s interval)")
+        logger.info("Background Polling Started (15s interval, leader-elected)")
+
+        if settings.RATE_LIMIT_ENABLED:
+            # Keep a reference so the task is not garbage-collected mid-run
+            application.state.loop_lag_task = asyncio.create_task(load_shedder.monitor_loop_lag())
+
+    @application.on_event("shutdown")
+    async def shutdown_event():
+        from app.services.iot_service import iot_service
+        iot_service.poller_lock.release()
+
+        loop_lag_task = getattr(application.state, "loop_lag_task", None)
+        if loop_lag_task:
+            loop_lag_task.cancel()
         
     @application.get("/health")
     async def health_check():
@@ -1,10 +1,13 @@
-from typing import Any, List
+from typing import Any, List, Optional
 from app.core.base import BaseRepository
+from app.db.supabase_client import service_supabase
 from datetime import datetime
 
 class TelemetryRepository(BaseRepository):
     def __init__(self):
         super().__init__("telemetry")
+        # Telemetry RLS admits no anon access
+        self.db = service_supabase
 
     async def log_reading(self, device_id: str, readings: dict) -> Any:
         data = {
@@ -17,3 +20,25 @@ class TelemetryRepository(BaseRepository):
         }
         response = self.db.table(self.table).insert(data).execute()
         return response.data[0] if response.data else None
+
+    async def get_recent(self, device_id: str, limit: int = 20) -> List[Any]:
+        # Newest first; served by idx_telemetry_device_timestamp
+        response = (self.db.table(self.table).select("*")
+                    .eq("device_id", device_id)
+                    .order("timestamp", desc=True)
+                    .limit(limit)
+                    .execute())
+        return response.data
+
+    async def get_range(self, device_id: str, start: datetime, end: datetime, limit: int,
+                        after: Optional[datetime] = None) -> List[Any]:
+        # Half-open [start, end) so monthly partitions outside the window are pruned;
+        # `after` is the keyset cursor (last timestamp of the previous page)
+        query = (self.db.table(self.table).select("*")
+                 .eq("device_id", device_id)
+                 .gte("timestamp", start.isoformat())
+                 .lt("timestamp", end.isoformat()))
+        if after is not None:
+            query = query.gt("timestamp", after.isoformat())
+        response = query.order("timestamp").limit(limit).execute()
+        return response.data
@@ -1,8 +1,12 @@
 import httpx
-from typing import Any, Dict, List, Optional
+import orjson
+from typing import Any, Dict, List, Optional, Tuple
 from app.core.base import BaseService
+from app.core.config import IOT_DEVICE_ID
 from app.repositories.telemetry_repository import TelemetryRepository
 from app.core.decorators import performance_monitor, validate_role
+from app.core.http_cache import make_etag
+from app.core.shared_state import StateStore, create_state_store, create_leader_lock
 from app.services.events import event_bus
 from loguru import logger
 from datetime import datetime, timedelta
@@ -44,20 +48,37 @@ class StatePredictor:
         estimated_time = datetime.utcnow() + timedelta(seconds=seconds_to_empty)
         return estimated_time.isoformat()
 
+DEFAULT_IOT_STATE: Dict[str, Any] = {
+    "temperature": 0.0,
+    "tank_level": 0.0,
+    "motor_on": False,
+    "drainage_on": False,
+    "predictions": {},
+    "last_update": None
+}
+
 class IotService(BaseService):
-    def __init__(self):
-        self.state = {
-            "temperature": 0.0,
-            "tank_level": 0.0,
-            "motor_on": False,
-            "drainage_on": False,
-            "predictions": {},
-            "last_update": None
-        }
+    def __init__(self, store: Optional[StateStore] = None):
+        # State lives in a shared store so every uvicorn worker sees the same values
+        self.store = store or create_state_store("iot", DEFAULT_IOT_STATE)
+        self.poller_lock = create_leader_lock("iot_poller")
         self.telemetry_repo = TelemetryRepository()
         self.ts_channel_id = os.getenv("TS_CHANNEL_ID")
         self.ts_read_api_key = os.getenv("TS_READ_API_KEY")
         self.blynk_token = os.getenv("BLYNK_AUTH_TOKEN")
+        # Serialized /status body, rebuilt only when the store version moves
+        self._status_version = -1
+        self._status_body = b""
+        self._status_etag = ""
+
+    @property
+    def state(self) -> Dict[str, Any]:
+        return self.store.read()
+
+    async def poll_if_leader(self):
+        """Scheduled in every worker; only the lock holder actually polls."""
+        if self.poller_lock.try_acquire():
+            await self.poll_thingspeak()
 
     @performance_monitor
     async def poll_thingspeak(self):
@@ -71,30 +92,39 @@ class IotService(BaseService):
                 response = await client.get(url)
                 if response.status_code == 200:
                     data = response.json()
+                    changed = False
+
+                    def apply_reading(state: Dict[str, Any]):
+                        nonlocal changed
+                        new_temp = float(data.get("field1", 0)) if data.get("field1") else state["temperature"]
+                        new_level = float(data.get("field2", 0)) if data.get("field2") else state["tank_level"]
+
+                        # Auto Motor Logic (Safety)
+                        if new_level <= 20: state["motor_on"] = True
+                        elif new_level >= 80: state["motor_on"] = False
+
+                        changed = (new_temp != state["temperature"] or
+                                   new_level != state["tank_level"])
+
+                        state.update({
+                            "temperature": new_temp,
+                            "tank_level": new_level,
+                            "last_update": datetime.utcnow().isoformat()
+                        })
+
+                    state = self.store.update(apply_reading)
                     
-                    new_temp = float(data.get("field1", 0)) if data.get("field1") else self.state["temperature"]
-                    new_level = float(data.get("field2", 0)) if data.get("field2") else self.state["tank_level"]
-                    
-                    # Auto Motor Logic (Safety)
-                    if new_level <= 20: self.state["motor_on"] = True
-                    elif new_level >= 80: self.state["motor_on"] = False
-                        
-                    has_changed = (new_temp != self.state["temperature"] or 
-                                  new_level != self.state["tank_level"])
-                                  
-                    self.state.update({
-                        "temperature": new_temp,
-                        "tank_level": new_level,
-                        "last_update": datetime.utcnow().isoformat()
-                    })
-                    
-                    if has_changed:
-                        await self.telemetry_repo.log_reading("main_iot_unit", self.state)
+                    if changed:
+                        # A failed telemetry write must not hold back the sync and the event
+                        try:
+                            await self.telemetry_repo.log_reading(IOT_DEVICE_ID, state)
+                        except Exception as e:
+                            logger.error(f"Telemetry Write Failed: {e}")
                         await self._update_predictions()
                         await self.sync_with_blynk()
                         
                         # Emit event for other services
-                        await event_bus.publish("iot_state_changed", self.state)
+                        await event_bus.emit("iot_state_changed", self.state)
                         
             except Exception as e:
                 logger.error(f"ThingSpeak Poll Failed: {e}")
@@ -102,28 +132,30 @@ class IotService(BaseService):
     async def _update_predictions(self):
         """Intelligent Layer: Calculate trends periodically."""
         try:
-            recent_readings = await self.telemetry_repo.get_all() # In production, limit to last 20
-            # Just take last 10 for estimation
-            subset = recent_readings[-10:] if len(recent_readings) > 10 else recent_readings
-            
-            prediction = StatePredictor.predict_empty_time(subset)
-            self.state["predictions"]["estimated_empty_at"] = prediction
+            # Last 10 readings are enough for the estimate; StatePredictor re-sorts by time
+            recent_readings = await self.telemetry_repo.get_recent(IOT_DEVICE_ID, limit=10)
+            prediction = StatePredictor.predict_empty_time(recent_readings)
+            self.store.update(lambda state: state["predictions"].update({"estimated_empty_at": prediction}))
         except Exception as e:
             logger.warning(f"Prediction failed: {e}")
 
     @validate_role(3) # ADMIN+ only
     async def toggle_motor(self, user: Any) -> bool:
-        self.state["motor_on"] = not self.state["motor_on"]
-        logger.info(f"AUDIT: User {user.get('email')} toggled motor to {self.state['motor_on']}")
+        def flip(state: Dict[str, Any]):
+            state["motor_on"] = not state["motor_on"]
+
+        motor_on = self.store.update(flip)["motor_on"]
+        logger.info(f"AUDIT: User {user.get('email')} toggled motor to {motor_on}")
         await self.sync_with_blynk()
-        await event_bus.emit("iot_motor_toggled", {"state": self.state["motor_on"], "user": user.get('email')})
-        return self.state["motor_on"]
+        await event_bus.emit("iot_motor_toggled", {"state": motor_on, "user": user.get('email')})
+        return motor_on
 
     async def sync_with_blynk(self):
         if not self.blynk_token: return
-        motor_val = 1 if self.state["motor_on"] else 0
+        state = self.state
+        motor_val = 1 if state["motor_on"] else 0
         url = (f"https://blynk.cloud/external/api/batch/update?token={self.blynk_token}"
-               f"&V1={self.state['temperature']}&V2={self.state['tank_level']}&V3={motor_val}")
+               f"&V1={state['temperature']}&V2={state['tank_level']}&V3={motor_val}")
         async with httpx.AsyncClient() as client:
             try: await client.get(url)
             except Exception as e: logger.error(f"Blynk Sync Failed: {e}")
@@ -131,4 +163,26 @@ class IotService(BaseService):
     def get_state(self) -> Dict[str, Any]:
         return self.state
 
+    async def get_history(self, device_id: str, start: datetime, end: datetime, limit: int,
+                          after: Optional[datetime] = None) -> Dict[str, Any]:
+        """
+        One page of readings in [start, end), oldest first. Fetches one extra row to tell
+        whether the page was truncated; if so `next_after` is the cursor for the next page.
+        """
+        rows = await self.telemetry_repo.get_range(device_id, start, end, limit + 1, after=after)
+        next_after = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_after = rows[-1]["timestamp"]
+        return {"readings": rows, "next_after": next_after}
+
+    def get_serialized_state(self) -> Tuple[bytes, str]:
+        """Return (json body, etag) for the current state, cached per state version."""
+        if self.store.version != self._status_version:
+            version, state = self.store.snapshot()
+            self._status_body = orjson.dumps(state)
+            self._status_etag = make_etag(self._status_body)
+            self._status_version = version
+        return self._status_body, self._status_etag
+
 iot_service = IotService()
@@ -0,0 +1,7 @@
+import os
+
+# app.db.supabase_client builds a client at import time; give it well-formed placeholders.
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_ANON_KEY", "test.test.test")
+# Keep IotService state in-process instead of creating files under $TMPDIR
+os.environ.setdefault("STATE_BACKEND", "local")
@@ -0,0 +1,48 @@
+import pytest
+from fastapi import Request
+from app.core.http_cache import cached_json_response, etag_matches, make_etag
+
+BODY = b'{"tank_level":42.0}'
+ETAG = make_etag(BODY)
+
+def make_request(if_none_match=None):
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match is not None else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+def test_make_etag_is_weak_and_stable():
+    assert ETAG.startswith('W/"')
+    assert make_etag(BODY) == ETAG
+    assert make_etag(b"{}") != ETAG
+
+@pytest.mark.parametrize("header", [
+    ETAG,
+    ETAG.removeprefix("W/"),
+    f'"other", {ETAG}',
+    f'W/"a",W/"b", {ETAG.removeprefix("W/")}',
+    "*",
+    " * ",
+])
+def test_etag_matches(header):
+    assert etag_matches(header, ETAG)
+
+@pytest.mark.parametrize("header", [None, "", 'W/"deadbeef"', '"a", "b"', ETAG[:-2] + '"'])
+def test_etag_mismatch(header):
+    assert not etag_matches(header, ETAG)
+
+def test_cached_json_response_serves_body():
+    response = cached_json_response(make_request(), BODY, ETAG)
+    assert response.status_code == 200
+    assert response.body == BODY
+    assert response.media_type == "application/json"
+    assert response.headers["etag"] == ETAG
+    assert response.headers["cache-control"] == "private, no-cache"
+
+def test_cached_json_response_not_modified():
+    response = cached_json_response(make_request(ETAG), BODY, ETAG)
+    assert response.status_code == 304
+    assert response.body == b""
+    assert response.headers["etag"] == ETAG
+
+def test_cached_json_response_stale_tag():
+    response = cached_json_response(make_request('W/"stale"'), BODY, ETAG)
+    assert response.status_code == 200
@@ -0,0 +1,80 @@
+from types import SimpleNamespace
+import httpx
+import pytest
+
+pytest.importorskip("supabase")
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.api import deps
+from app.api.v1.endpoints import iot
+from app.core.shared_state import LocalStateStore
+from app.services.iot_service import DEFAULT_IOT_STATE, IotService, event_bus
+
+def set_level(level):
+    def mutate(state):
+        state["tank_level"] = level
+    return mutate
+
+@pytest.fixture
+def service():
+    return IotService(store=LocalStateStore(DEFAULT_IOT_STATE))
+
+@pytest.fixture
+def client(service, monkeypatch):
+    monkeypatch.setattr(iot, "iot_service", service)
+    app = FastAPI()
+    app.include_router(iot.router, prefix="/iot")
+    app.dependency_overrides[deps.get_current_user] = lambda: {"id": "u1", "role": "CUSTOMER"}
+    return TestClient(app)
+
+def test_serialized_state_is_reused_until_version_moves(service):
+    body, etag = service.get_serialized_state()
+    again, same_etag = service.get_serialized_state()
+    assert again is body
+    assert same_etag == etag
+
+    service.store.update(set_level(55.0))
+    new_body, new_etag = service.get_serialized_state()
+    assert new_body is not body
+    assert new_etag != etag
+    assert b'"tank_level":55.0' in new_body
+
+def test_status_returns_304_until_state_changes(client, service):
+    first = client.get("/iot/status")
+    assert first.status_code == 200
+    assert first.json() == DEFAULT_IOT_STATE
+    etag = first.headers["etag"]
+
+    cached = client.get("/iot/status", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+
+    service.store.update(set_level(12.5))
+    changed = client.get("/iot/status", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+    assert changed.json()["tank_level"] == 12.5
+
+async def test_poll_still_syncs_when_telemetry_write_fails(service, monkeypatch):
+    async def thingspeak(self, url):
+        return SimpleNamespace(status_code=200, json=lambda: {"field1": "24.5", "field2": "60"})
+
+    async def rejected(device_id, readings):
+        raise RuntimeError("new row violates row-level security policy")
+
+    calls = []
+
+    async def record(name, *args):
+        calls.append(name)
+
+    monkeypatch.setattr(httpx.AsyncClient, "get", thingspeak)
+    monkeypatch.setattr(service.telemetry_repo, "log_reading", rejected)
+    monkeypatch.setattr(service, "_update_predictions", lambda: record("predictions"))
+    monkeypatch.setattr(service, "sync_with_blynk", lambda: record("blynk"))
+    monkeypatch.setattr(event_bus, "emit", lambda name, state: record(name))
+    service.ts_channel_id, service.ts_read_api_key = "1", "key"
+
+    await service.poll_thingspeak()
+    assert service.state["tank_level"] == 60.0
+    assert calls == ["predictions", "blynk", "iot_state_changed"]
@@ -0,0 +1,183 @@
+from datetime import timedelta
+import pytest
+from jose import jwt
+from fastapi.responses import PlainTextResponse
+from fastapi.testclient import TestClient
+from app.core import rate_limit
+from app.core.config import IOT_DEVICE_ID, settings
+from app.core.security import create_access_token
+from app.core.rate_limit import LoadShedder, RateLimitMiddleware, RateRule, TokenBucketLimiter
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limit.time, "monotonic", lambda: now[0])
+    return now
+
+async def ok_app(scope, receive, send):
+    await PlainTextResponse("ok")(scope, receive, send)
+
+def with_peer(app, ip="10.0.0.1"):
+    async def wrapped(scope, receive, send):
+        await app({**scope, "client": (ip, 5000)}, receive, send)
+    return wrapped
+
+def make_client(rules, shedder=None):
+    shedder = shedder or LoadShedder(max_in_flight=100, max_loop_lag=1.0)
+    return TestClient(with_peer(RateLimitMiddleware(ok_app, rules=rules, shedder=shedder)))
+
+def test_bucket_allows_burst_then_waits(clock):
+    limiter = TokenBucketLimiter(rate=1.0, burst=3, max_keys=10)
+    assert [limiter.acquire("a") for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert limiter.acquire("a") == pytest.approx(1.0)
+    assert limiter.acquire("b") == 0.0
+
+def test_bucket_refills_up_to_burst(clock):
+    limiter = TokenBucketLimiter(rate=2.0, burst=2, max_keys=10)
+    limiter.acquire("a")
+    limiter.acquire("a")
+    assert limiter.check("a") == pytest.approx(0.5)
+
+    clock[0] += 0.5
+    assert limiter.check("a") == 0.0
+    assert limiter.acquire("a") == 0.0
+
+    clock[0] += 60
+    assert [limiter.acquire("a") for _ in range(3)][-1] > 0
+
+def test_check_does_not_consume(clock):
+    limiter = TokenBucketLimiter(rate=1.0, burst=1, max_keys=10)
+    assert limiter.check("a") == 0.0
+    assert limiter.check("a") == 0.0
+    assert limiter.acquire("a") == 0.0
+    assert limiter.check("a") > 0
+
+def test_bucket_evicts_least_recently_used(clock):
+    limiter = TokenBucketLimiter(rate=0.001, burst=1, max_keys=2)
+    limiter.acquire("a")
+    limiter.acquire("b")
+    limiter.acquire("a")  # refreshes "a"
+    limiter.acquire("c")  # evicts "b"
+
+    assert set(limiter._buckets) == {"a", "c"}
+    assert limiter.acquire("b") == 0.0
+
+def test_rejects_with_429_and_retry_after():
+    client = make_client([RateRule("/ai/command", "ip", 60, 2)])
+    url = f"{settings.API_V1_STR}/ai/command"
+
+    assert client.post(url).status_code == 200
+    assert client.post(url).status_code == 200
+    response = client.post(url)
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "1"
+    assert client.get(f"{settings.API_V1_STR}/iot/status").status_code == 200
+
+def test_rejected_request_does_not_drain_other_buckets():
+    rules = [
+        RateRule("/iot/motor/toggle", "ip", 60, 5),
+        RateRule("/iot/motor/toggle", "device", 60, 1),
+    ]
+    middleware = RateLimitMiddleware(ok_app, rules=rules, shedder=LoadShedder(100, 1.0))
+    client = TestClient(with_peer(middleware))
+    url = f"{settings.API_V1_STR}/iot/motor/toggle"
+
+    assert client.post(url).status_code == 200
+    for _ in range(3):
+        assert client.post(url).status_code == 429
+
+    ip_bucket = middleware.limiters[rules[0]]._buckets["ip:10.0.0.1"]
+    assert ip_bucket[0] == pytest.approx(4, abs=0.1)
+
+def test_device_keys_are_separate():
+    rules = [RateRule("/iot/motor/toggle", "device", 60, 1)]
+    client = make_client(rules)
+    url = f"{settings.API_V1_STR}/iot/motor/toggle"
+
+    assert client.post(url, params={"device_id": "a"}).status_code == 200
+    assert client.post(url, params={"device_id": "b"}).status_code == 200
+    assert client.post(url, params={"device_id": "a"}).status_code == 429
+
+def bearer(token):
+    return [(b"authorization", f"Bearer {token}".encode())]
+
+def scope_with(headers=(), query=b""):
+    return {"type": "http", "client": ("10.0.0.1", 5000), "headers": list(headers), "query_string": query}
+
+def key_for(key_scope, scope):
+    return RateLimitMiddleware(ok_app, rules=[])._key_for(key_scope, scope)
+
+def test_device_key_defaults_to_the_driven_device():
+    assert key_for("device", scope_with()) == f"device:{IOT_DEVICE_ID}"
+    assert key_for("device", scope_with(query=b"device_id=pump2")) == "device:pump2"
+
+def test_valid_token_keys_by_user_id():
+    assert key_for("user", scope_with(bearer(create_access_token("u1")))) == "user:u1"
+
+@pytest.mark.parametrize("headers", [
+    [],
+    bearer(create_access_token("u1", expires_delta=timedelta(seconds=-10))),
+    bearer(jwt.encode({"sub": "u1"}, "not-the-secret", algorithm=settings.ALGORITHM)),
+    bearer("garbage"),
+    [(b"authorization", b"Basic dTE6cHc=")],
+])
+def test_missing_or_invalid_token_falls_back_to_ip(headers):
+    assert key_for("user", scope_with(headers)) == "ip:10.0.0.1"
+
+def test_users_behind_one_ip_get_separate_buckets():
+    client = make_client([RateRule("/ai/command", "user", 60, 1)])
+    url = f"{settings.API_V1_STR}/ai/command"
+    alice = {"Authorization": f"Bearer {create_access_token('alice')}"}
+    bob = {"Authorization": f"Bearer {create_access_token('bob')}"}
+    expired = {"Authorization": f"Bearer {create_access_token('bob', expires_delta=timedelta(seconds=-10))}"}
+
+    assert client.post(url, headers=alice).status_code == 200
+    assert client.post(url, headers=alice).status_code == 429
+    assert client.post(url, headers=bob).status_code == 200
+    # An expired token is keyed by IP, which has its own untouched bucket
+    assert client.post(url, headers=expired).status_code == 200
+    assert client.post(url).status_code == 429
+
+def test_trusted_proxy_uses_forwarded_for(monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMIT_TRUSTED_PROXIES", ["10.0.0.1"])
+    client = make_client([RateRule("/auth/login", "ip", 60, 1)])
+    url = f"{settings.API_V1_STR}/auth/login"
+
+    assert client.post(url, headers={"X-Forwarded-For": "1.1.1.1"}).status_code == 200
+    assert client.post(url, headers={"X-Forwarded-For": "2.2.2.2"}).status_code == 200
+    assert client.post(url, headers={"X-Forwarded-For": "9.9.9.9, 1.1.1.1"}).status_code == 429
+
+def test_untrusted_peer_ignores_forwarded_for():
+    client = make_client([RateRule("/auth/login", "ip", 60, 1)])
+    url = f"{settings.API_V1_STR}/auth/login"
+
+    assert client.post(url, headers={"X-Forwarded-For": "1.1.1.1"}).status_code == 200
+    assert client.post(url, headers={"X-Forwarded-For": "2.2.2.2"}).status_code == 429
+
+@pytest.mark.parametrize("in_flight, loop_lag", [(5, 0.0), (0, 0.5)])
+def test_sheds_with_503_when_overloaded(in_flight, loop_lag):
+    shedder = LoadShedder(max_in_flight=5, max_loop_lag=0.25)
+    shedder.in_flight, shedder.loop_lag = in_flight, loop_lag
+    client = make_client([], shedder)
+
+    response = client.post(f"{settings.API_V1_STR}/ai/command")
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+
+    # Critical paths are never shed
+    assert client.get("/health").status_code == 200
+    assert client.get(f"{settings.API_V1_STR}/iot/status").status_code == 200
+    assert client.post(f"{settings.API_V1_STR}/iot/motor/toggle").status_code == 200
+
+def test_not_shed_under_threshold():
+    shedder = LoadShedder(max_in_flight=5, max_loop_lag=0.25)
+    shedder.in_flight, shedder.loop_lag = 4, 0.1
+    assert make_client([], shedder).post(f"{settings.API_V1_STR}/ai/command").status_code == 200
+    assert shedder.in_flight == 4
+
+def test_options_bypasses_limits_and_shedding():
+    shedder = LoadShedder(max_in_flight=0, max_loop_lag=0.0)
+    client = make_client([RateRule(None, "ip", 60, 1)], shedder)
+
+    for _ in range(3):
+        assert client.options(f"{settings.API_V1_STR}/ai/command").status_code == 200
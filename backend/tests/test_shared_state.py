@@ -0,0 +1,159 @@
+import os
+import threading
+import pytest
+from app.core.shared_state import _HEADER, LeaderLock, LocalStateStore, MmapStateStore
+
+DEFAULT = {"count": 0, "motor_on": False, "predictions": {}}
+SIZE = 4096
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "test.state")
+
+def increment(state):
+    state["count"] += 1
+
+def test_update_bumps_version_and_snapshot_is_cached(path):
+    store = MmapStateStore(path, DEFAULT, SIZE)
+    start = store.version
+    assert start % 2 == 0
+
+    store.update(increment)
+    assert store.version == start + 2
+    assert store._current()[1] is store._current()[1]
+    assert store.read()["count"] == 1
+
+def test_other_instance_sees_update(path):
+    writer = MmapStateStore(path, DEFAULT, SIZE)
+    reader = MmapStateStore(path, DEFAULT, SIZE)
+    reader.read()
+
+    writer.update(increment)
+    version, state = reader.snapshot()
+    assert version == writer.version
+    assert state["count"] == 1
+
+def test_returned_state_is_a_copy(path):
+    for store in (MmapStateStore(path, DEFAULT, SIZE), LocalStateStore(DEFAULT)):
+        store.read()["predictions"]["x"] = 1
+        store.update(increment)["count"] = 99
+        assert store.read() == {"count": 1, "motor_on": False, "predictions": {}}
+
+def test_update_is_atomic_across_instances(path):
+    stores = [MmapStateStore(path, DEFAULT, SIZE) for _ in range(2)]
+
+    def hammer(store):
+        for _ in range(200):
+            store.update(increment)
+
+    threads = [threading.Thread(target=hammer, args=(store,)) for store in stores]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert stores[0].read()["count"] == 400
+    assert stores[1].read()["count"] == 400
+
+def test_missing_default_keys_are_merged(path):
+    MmapStateStore(path, {"count": 5}, SIZE)
+    store = MmapStateStore(path, DEFAULT, SIZE)
+    assert store.read() == {"count": 5, "motor_on": False, "predictions": {}}
+
+def test_torn_write_is_recovered_by_next_update(path):
+    store = MmapStateStore(path, DEFAULT, SIZE)
+    reader = MmapStateStore(path, DEFAULT, SIZE)
+    store.update(increment)
+    reader.read()
+    version, length = _HEADER.unpack_from(store._mm, 0)
+    _HEADER.pack_into(store._mm, 0, version + 1, length)  # writer died after the first bump
+
+    store.update(increment)
+    assert store.version % 2 == 0
+    assert reader.read()["count"] == 2
+
+def test_reader_repairs_torn_write_instead_of_spinning(path):
+    store = MmapStateStore(path, DEFAULT, SIZE)
+    reader = MmapStateStore(path, DEFAULT, SIZE)
+    version, length = _HEADER.unpack_from(store._mm, 0)
+    _HEADER.pack_into(store._mm, 0, version + 1, length)
+
+    assert reader.read() == DEFAULT
+    assert reader.version % 2 == 0
+
+def test_corrupt_payload_falls_back_to_default(path):
+    store = MmapStateStore(path, DEFAULT, SIZE)
+    store.update(increment)
+    store._mm[_HEADER.size:_HEADER.size + 4] = b"\xff\xff\xff\xff"
+
+    assert MmapStateStore(path, DEFAULT, SIZE).read() == DEFAULT
+
+def test_leader_lock_is_exclusive(tmp_path):
+    lock_path = str(tmp_path / "poller.lock")
+    first, second = LeaderLock(lock_path), LeaderLock(lock_path)
+
+    assert first.try_acquire()
+    assert first.try_acquire()
+    assert not second.try_acquire()
+    assert not second.is_leader
+
+    first.release()
+    assert second.try_acquire()
+    assert not first.try_acquire()
+    second.release()
+
+def test_existing_reader_repairs_corrupt_payload(path):
+    store = MmapStateStore(path, DEFAULT, SIZE)
+    reader = MmapStateStore(path, DEFAULT, SIZE)
+    store.update(increment)
+    assert reader.read()["count"] == 1
+
+    # Garbage behind a stable, even version that the reader has not cached yet
+    version, length = _HEADER.unpack_from(store._mm, 0)
+    store._mm[_HEADER.size:_HEADER.size + 4] = b"\xff\xff\xff\xff"
+    _HEADER.pack_into(store._mm, 0, version + 2, length)
+
+    assert reader.read() == DEFAULT
+    assert reader.version % 2 == 0
+    assert store.read() == DEFAULT
+
+def _run_in_child(target):
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            code = 0 if target() else 1
+        finally:
+            os._exit(code)
+    return pid
+
+def _wait_ok(pid):
+    _, status = os.waitpid(pid, 0)
+    return os.waitstatus_to_exitcode(status) == 0
+
+def test_update_is_atomic_across_forked_workers(path):
+    # Store opened before fork, as with gunicorn --preload
+    store = MmapStateStore(path, DEFAULT, SIZE)
+
+    def hammer():
+        for _ in range(300):
+            store.update(increment)
+        return True
+
+    pids = [_run_in_child(hammer) for _ in range(3)]
+    assert all(_wait_ok(pid) for pid in pids)
+    assert store.read()["count"] == 900
+
+def test_leader_lock_is_not_inherited_across_fork(tmp_path):
+    lock = LeaderLock(str(tmp_path / "poller.lock"))
+    assert lock.try_acquire()
+
+    def child():
+        ok = not lock.is_leader and not lock.try_acquire()
+        lock.release()
+        return ok
+
+    assert _wait_ok(_run_in_child(child))
+    # The child's release() must not have freed the parent's lock
+    assert not LeaderLock(lock.path).try_acquire()
+    lock.release()
@@ -0,0 +1,125 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+import pytest
+
+pytest.importorskip("supabase")
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.api import deps
+from app.api.v1.endpoints import iot
+from app.repositories.telemetry_repository import TelemetryRepository
+from app.core.config import IOT_DEVICE_ID
+from app.services.iot_service import iot_service
+
+class RecordingQuery:
+    """Stands in for the PostgREST builder and records the chained calls."""
+    def __init__(self, table: str):
+        self.calls = [("table", (table,), {})]
+
+    def __getattr__(self, name):
+        def record(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+            return self
+        return record
+
+    def execute(self):
+        return SimpleNamespace(data=[{"device_id": "d1"}])
+
+@pytest.fixture
+def repo():
+    repo = TelemetryRepository()
+    repo.queries = []
+
+    def table(name):
+        repo.queries.append(RecordingQuery(name))
+        return repo.queries[-1]
+
+    repo.db = SimpleNamespace(table=table)
+    return repo
+
+async def test_get_recent_orders_newest_first(repo):
+    assert await repo.get_recent("d1", limit=5) == [{"device_id": "d1"}]
+    assert repo.queries[0].calls == [
+        ("table", ("telemetry",), {}),
+        ("select", ("*",), {}),
+        ("eq", ("device_id", "d1"), {}),
+        ("order", ("timestamp",), {"desc": True}),
+        ("limit", (5,), {}),
+    ]
+
+async def test_get_range_is_half_open_and_limited(repo):
+    start = datetime(2026, 10, 1, tzinfo=timezone.utc)
+    end = datetime(2026, 10, 2, tzinfo=timezone.utc)
+    await repo.get_range("d1", start, end, 100)
+    assert repo.queries[0].calls == [
+        ("table", ("telemetry",), {}),
+        ("select", ("*",), {}),
+        ("eq", ("device_id", "d1"), {}),
+        ("gte", ("timestamp", "2026-10-01T00:00:00+00:00"), {}),
+        ("lt", ("timestamp", "2026-10-02T00:00:00+00:00"), {}),
+        ("order", ("timestamp",), {}),
+        ("limit", (100,), {}),
+    ]
+
+async def test_get_range_continues_after_cursor(repo):
+    start = datetime(2026, 10, 1, tzinfo=timezone.utc)
+    end = datetime(2026, 10, 2, tzinfo=timezone.utc)
+    await repo.get_range("d1", start, end, 100, after=datetime(2026, 10, 1, 6, tzinfo=timezone.utc))
+    assert ("gt", ("timestamp", "2026-10-01T06:00:00+00:00"), {}) in repo.queries[0].calls
+
+def reading(minute):
+    return {"device_id": IOT_DEVICE_ID, "timestamp": f"2026-10-01T00:{minute:02d}:00+00:00"}
+
+@pytest.fixture
+def client(monkeypatch):
+    calls = []
+    rows = [reading(m) for m in range(5)]
+
+    async def get_range(device_id, start, end, limit, after=None):
+        calls.append((device_id, start, end, limit, after))
+        remaining = [r for r in rows if after is None or datetime.fromisoformat(r["timestamp"]) > after]
+        return remaining[:limit]
+
+    monkeypatch.setattr(iot_service.telemetry_repo, "get_range", get_range)
+    app = FastAPI()
+    app.include_router(iot.router, prefix="/iot")
+    app.dependency_overrides[deps.get_current_user] = lambda: {"id": "u1", "role": "CUSTOMER"}
+    client = TestClient(app)
+    client.calls = calls
+    return client
+
+DAY = {"start": "2026-10-01T00:00:00", "end": "2026-10-02T00:00:00"}
+
+def test_history_endpoint_uses_range_query(client):
+    response = client.get("/iot/history", params=DAY)
+    assert response.status_code == 200
+    assert response.json() == {"readings": [reading(m) for m in range(5)], "next_after": None}
+    assert client.calls == [(
+        IOT_DEVICE_ID,
+        datetime(2026, 10, 1, tzinfo=timezone.utc),
+        datetime(2026, 10, 2, tzinfo=timezone.utc),
+        501,
+        None,
+    )]
+
+def test_history_endpoint_pages_with_cursor(client):
+    first = client.get("/iot/history", params={**DAY, "limit": 3}).json()
+    assert first == {"readings": [reading(m) for m in range(3)], "next_after": reading(2)["timestamp"]}
+
+    rest = client.get("/iot/history", params={**DAY, "limit": 3, "after": first["next_after"]}).json()
+    assert rest == {"readings": [reading(3), reading(4)], "next_after": None}
+    assert client.calls[1][4] == datetime(2026, 10, 1, 0, 2, tzinfo=timezone.utc)
+
+@pytest.mark.parametrize("params", [
+    {"start": "2026-10-02T00:00:00", "end": "2026-10-01T00:00:00"},
+    {"start": "2026-01-01T00:00:00", "end": "2026-03-01T00:00:00"},
+])
+def test_history_endpoint_rejects_bad_ranges(client, params):
+    assert client.get("/iot/history", params=params).status_code == 400
+    assert client.calls == []
+
+@pytest.mark.parametrize("limit", [0, 1000])
+def test_history_endpoint_bounds_limit(client, limit):
+    assert client.get("/iot/history", params={**DAY, "limit": limit}).status_code == 422
+    assert client.calls == []
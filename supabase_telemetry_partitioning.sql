@@ -0,0 +1,162 @@
+-- EvaraTech Telemetry Partitioning Migration
+-- Run after supabase_schema.sql. Safe to re-run.
+--
+-- Converts `telemetry` into a table range-partitioned by month on "timestamp",
+-- adds a (device_id, timestamp) index for last-N / range lookups and a BRIN
+-- index for wide time scans, and drops partitions past the retention window.
+
+-- Move an existing, unpartitioned telemetry table out of the way
+-- (resolved through search_path, like every other statement in this file)
+DO $$
+DECLARE
+  existing REGCLASS := to_regclass('telemetry');
+BEGIN
+  IF existing IS NOT NULL AND (SELECT relkind FROM pg_class WHERE oid = existing) = 'r' THEN
+    EXECUTE format('ALTER TABLE %s RENAME TO telemetry_legacy', existing);
+  END IF;
+END $$;
+
+-- Telemetry Table (partitioned)
+CREATE TABLE IF NOT EXISTS telemetry (
+  id BIGINT GENERATED BY DEFAULT AS IDENTITY,
+  device_id TEXT NOT NULL,
+  temperature DOUBLE PRECISION,
+  tank_level DOUBLE PRECISION,
+  motor_on BOOLEAN,
+  drainage_on BOOLEAN,
+  "timestamp" TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+  PRIMARY KEY (id, "timestamp")
+) PARTITION BY RANGE ("timestamp");
+
+-- Catches rows outside every monthly partition so inserts never fail
+CREATE TABLE IF NOT EXISTS telemetry_default PARTITION OF telemetry DEFAULT;
+ALTER TABLE telemetry_default ENABLE ROW LEVEL SECURITY;
+
+-- Indexes are declared on the parent and created on every partition
+CREATE INDEX IF NOT EXISTS idx_telemetry_device_timestamp ON telemetry (device_id, "timestamp" DESC);
+CREATE INDEX IF NOT EXISTS idx_telemetry_timestamp_brin ON telemetry USING BRIN ("timestamp");
+
+-- Create the partition holding the month of `month_start`.
+-- Rows that already landed in telemetry_default for that month (maintenance
+-- lapsed) are moved into the new table before it is attached; attaching a
+-- range the default partition still holds rows for would fail.
+CREATE OR REPLACE FUNCTION create_telemetry_partition(month_start DATE)
+RETURNS TEXT AS $$
+DECLARE
+  range_start DATE := date_trunc('month', month_start)::DATE;
+  range_end DATE := (date_trunc('month', month_start) + INTERVAL '1 month')::DATE;
+  partition_name TEXT := 'telemetry_' || to_char(range_start, 'YYYY_MM');
+BEGIN
+  IF to_regclass(partition_name) IS NOT NULL THEN
+    RETURN partition_name;
+  END IF;
+
+  IF EXISTS (SELECT 1 FROM telemetry_default WHERE "timestamp" >= range_start AND "timestamp" < range_end) THEN
+    EXECUTE format('CREATE TABLE %I (LIKE telemetry INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', partition_name);
+    EXECUTE format(
+      'WITH moved AS (DELETE FROM telemetry_default WHERE "timestamp" >= %L AND "timestamp" < %L RETURNING *) '
+      'INSERT INTO %I SELECT * FROM moved',
+      range_start, range_end, partition_name
+    );
+    EXECUTE format(
+      'ALTER TABLE telemetry ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+      partition_name, range_start, range_end
+    );
+  ELSE
+    EXECUTE format(
+      'CREATE TABLE %I PARTITION OF telemetry FOR VALUES FROM (%L) TO (%L)',
+      partition_name, range_start, range_end
+    );
+  END IF;
+
+  -- Partitions are reachable directly through the API; without policies this denies all
+  EXECUTE format('ALTER TABLE %I ENABLE ROW LEVEL SECURITY', partition_name);
+  RETURN partition_name;
+END;
+$$ language 'plpgsql';
+
+-- Keep partitions ahead of now and drop those past the retention window
+CREATE OR REPLACE FUNCTION maintain_telemetry_partitions(retention_months INTEGER DEFAULT 12, months_ahead INTEGER DEFAULT 2)
+RETURNS VOID AS $$
+DECLARE
+  cutoff DATE := (date_trunc('month', NOW()) - make_interval(months => retention_months))::DATE;
+  part RECORD;
+BEGIN
+  FOR i IN 0..months_ahead LOOP
+    PERFORM create_telemetry_partition((date_trunc('month', NOW()) + make_interval(months => i))::DATE);
+  END LOOP;
+
+  FOR part IN
+    SELECT c.relname
+    FROM pg_inherits inh
+    JOIN pg_class c ON c.oid = inh.inhrelid
+    WHERE inh.inhparent = 'telemetry'::regclass
+      AND c.relname ~ '^telemetry_\d{4}_\d{2}$'
+      AND to_date(substring(c.relname FROM 11), 'YYYY_MM') < cutoff
+  LOOP
+    EXECUTE format('DROP TABLE %I', part.relname);
+  END LOOP;
+
+  DELETE FROM telemetry_default WHERE "timestamp" < cutoff;
+END;
+$$ language 'plpgsql';
+
+-- Copy legacy rows into the partitioned table (first run only)
+DO $$
+DECLARE
+  first_month DATE;
+BEGIN
+  IF to_regclass('telemetry_legacy') IS NOT NULL AND NOT EXISTS (SELECT 1 FROM telemetry) THEN
+    SELECT date_trunc('month', MIN("timestamp"::TIMESTAMPTZ))::DATE INTO first_month FROM telemetry_legacy;
+    WHILE first_month IS NOT NULL AND first_month <= NOW() LOOP
+      PERFORM create_telemetry_partition(first_month);
+      first_month := (first_month + INTERVAL '1 month')::DATE;
+    END LOOP;
+
+    INSERT INTO telemetry (device_id, temperature, tank_level, motor_on, drainage_on, "timestamp")
+    SELECT device_id, temperature, tank_level, motor_on, drainage_on, "timestamp"::TIMESTAMPTZ
+    FROM telemetry_legacy;
+  END IF;
+END $$;
+
+SELECT maintain_telemetry_partitions();
+
+-- Row Level Security (RLS) Policies
+-- Policies apply to reads and writes through the parent; each partition also
+-- has RLS enabled with no policies. The backend's telemetry repository uses the
+-- service role key, which bypasses RLS, so the anon key shipped in the frontend
+-- gets no access.
+ALTER TABLE telemetry ENABLE ROW LEVEL SECURITY;
+
+DO $$
+BEGIN
+  IF to_regclass('telemetry_legacy') IS NOT NULL THEN
+    ALTER TABLE telemetry_legacy ENABLE ROW LEVEL SECURITY;
+  END IF;
+END $$;
+
+DROP POLICY IF EXISTS "Allow authenticated read on telemetry" ON telemetry;
+CREATE POLICY "Allow authenticated read on telemetry"
+  ON telemetry FOR SELECT
+  USING (auth.role() = 'authenticated');
+
+DROP POLICY IF EXISTS "Allow authenticated insert on telemetry" ON telemetry;
+CREATE POLICY "Allow authenticated insert on telemetry"
+  ON telemetry FOR INSERT
+  WITH CHECK (auth.role() = 'authenticated');
+
+-- Run retention daily when pg_cron is enabled (Database > Extensions in Supabase).
+-- `SET evaratech.skip_cron = on` beforehand to load the schema without a job (scratch copies).
+DO $$
+BEGIN
+  IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_cron')
+     AND current_setting('evaratech.skip_cron', true) IS DISTINCT FROM 'on' THEN
+    PERFORM cron.schedule('maintain-telemetry-partitions', '15 0 * * *', 'SELECT maintain_telemetry_partitions()');
+  END IF;
+END $$;
+
+-- Comments for documentation
+COMMENT ON TABLE telemetry IS 'IoT readings, range-partitioned by month on timestamp';
+COMMENT ON FUNCTION maintain_telemetry_partitions(INTEGER, INTEGER) IS 'Creates upcoming monthly partitions and drops those older than retention_months';
+COMMENT ON INDEX idx_telemetry_device_timestamp IS 'Serves last-N and time-range reads per device';
+COMMENT ON INDEX idx_telemetry_timestamp_brin IS 'Compact index for time-range scans across all devices';